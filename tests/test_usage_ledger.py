@@ -0,0 +1,242 @@
+"""Tests for usage_ledger.py: file format, snapshot replay and crash recovery."""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from usage_ledger import MAGIC, UsageLedger  # noqa: E402
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "usage.ledger")
+
+
+def fill(ledger):
+    ledger.record("chatgpt", "description", 1000, 500, timestamp=100.0)
+    ledger.record("chatgpt", "tags", 200, 100, timestamp=200.0)
+    ledger.record("gemini", "description", 800, 400, timestamp=150.0)
+
+
+def test_round_trip_through_file_and_snapshot(path):
+    with UsageLedger(path) as ledger:
+        fill(ledger)
+
+    with open(path, "rb") as f:
+        assert f.read(len(MAGIC)) == MAGIC
+    with open(path + ".agg.json", encoding="utf-8") as f:
+        assert json.load(f)["offset"] == os.path.getsize(path)
+
+    reloaded = UsageLedger(path)
+    assert reloaded.totals == {
+        "chatgpt": {"description": [1, 1000, 500, 0.025], "tags": [1, 200, 100, 0.005]},
+        "gemini": {"description": [1, 800, 400, 0.0]},
+    }
+    assert (reloaded.first_ts, reloaded.last_ts) == (100.0, 200.0)
+
+
+def test_by_model_and_grand_total(path):
+    ledger = UsageLedger(path)
+    fill(ledger)
+    assert ledger.by_model() == {
+        "chatgpt": [2, 1200, 600, pytest.approx(0.03)],
+        "gemini": [1, 800, 400, 0.0],
+    }
+    assert ledger.grand_total() == [3, 2000, 1000, pytest.approx(0.03)]
+
+
+def test_replay_without_snapshot(path):
+    with UsageLedger(path) as ledger:
+        fill(ledger)
+    expected = UsageLedger(path).totals
+    os.remove(path + ".agg.json")
+
+    assert UsageLedger(path).totals == expected
+    assert os.path.exists(path + ".agg.json")
+
+
+def test_replay_records_newer_than_snapshot(path):
+    with UsageLedger(path) as ledger:
+        fill(ledger)
+    with open(path + ".agg.json", encoding="utf-8") as f:
+        stale = f.read()
+
+    with UsageLedger(path) as ledger:
+        ledger.record("gemini", "seo", 10, 10)
+    with open(path + ".agg.json", "w", encoding="utf-8") as f:
+        f.write(stale)
+
+    reloaded = UsageLedger(path)
+    assert reloaded.totals["gemini"]["seo"] == [1, 10, 10, 0.0]
+    assert reloaded.grand_total()[0] == 4
+
+
+def test_flushes_at_batch_size(path):
+    ledger = UsageLedger(path, batch_size=2)
+    ledger.record("chatgpt", "tags", 1, 1)
+    assert not os.path.exists(path)
+
+    ledger.record("chatgpt", "tags", 1, 1)
+    size = os.path.getsize(path)
+    assert UsageLedger(path).grand_total()[0] == 2
+
+    ledger.record("chatgpt", "tags", 1, 1)
+    assert os.path.getsize(path) == size
+    ledger.close()
+    assert UsageLedger(path).grand_total()[0] == 3
+
+
+def test_truncated_tail_is_ignored_then_dropped(path):
+    with UsageLedger(path) as ledger:
+        fill(ledger)
+    os.remove(path + ".agg.json")
+    with open(path, "ab") as f:
+        f.write(b"E\x00\x01\x02")
+
+    ledger = UsageLedger(path)
+    assert ledger.grand_total()[0] == 3
+    ledger.record("gemini", "tags", 5, 5)
+    ledger.close()
+
+    os.remove(path + ".agg.json")
+    reloaded = UsageLedger(path)
+    assert reloaded.grand_total()[0] == 4
+    assert reloaded.totals["gemini"]["tags"] == [1, 5, 5, 0.0]
+
+
+def test_partial_header_opens_as_empty(path):
+    with open(path, "wb") as f:
+        f.write(MAGIC[:2])
+
+    ledger = UsageLedger(path)
+    assert ledger.totals == {}
+    ledger.record("chatgpt", "tags", 1, 1)
+    ledger.close()
+    assert UsageLedger(path).grand_total()[0] == 1
+
+
+def test_not_a_ledger(path):
+    with open(path, "wb") as f:
+        f.write(b"Timestamp,Model,Task\n")
+    with pytest.raises(ValueError):
+        UsageLedger(path)
+
+
+def test_two_writers_share_one_file(path):
+    first = UsageLedger(path, batch_size=1)
+    second = UsageLedger(path, batch_size=1)
+    first.record("chatgpt", "desc", 1000, 1000)
+    second.record("gemini", "seo", 1010, 1010)
+    first.record("chatgpt", "desc", 1000, 1000)
+
+    # Each writer catches up on the other's records when it flushes
+    assert first.grand_total()[0] == 3
+
+    os.remove(path + ".agg.json")
+    assert UsageLedger(path).totals == {
+        "chatgpt": {"desc": [2, 2000, 2000, pytest.approx(0.08)]},
+        "gemini": {"seo": [1, 1010, 1010, 0.0]},
+    }
+
+
+def test_conflicting_string_entry_raises(path):
+    with UsageLedger(path) as ledger:
+        ledger.record("chatgpt", "desc", 1, 1)
+    os.remove(path + ".agg.json")
+    with open(path, "ab") as f:
+        # Re-declares id 0 as a different name
+        f.write(b"S\x00\x00\x06\x00gemini")
+    with pytest.raises(ValueError, match="conflicts"):
+        UsageLedger(path)
+
+
+def test_record_validates_before_buffering(path):
+    ledger = UsageLedger(path)
+    assert ledger.record("chatgpt", "x", 12.0, 3) == pytest.approx(0.00021)
+    with pytest.raises(ValueError):
+        ledger.record("chatgpt", "y", -1, 3)
+    with pytest.raises(ValueError):
+        ledger.record("chatgpt", "y", 2 ** 32, 3)
+
+    assert ledger.strings == []
+    assert "y" not in ledger.totals["chatgpt"]
+    ledger.close()
+    assert UsageLedger(path).totals == {"chatgpt": {"x": [1, 12, 3, pytest.approx(0.00021)]}}
+
+
+def test_ledger_deleted_under_live_writer(path):
+    ledger = UsageLedger(path, batch_size=1)
+    ledger.record("chatgpt", "desc", 1000, 1000)
+    os.remove(path)
+    ledger.record("gemini", "seo", 10, 10)
+
+    # Totals restart with the new file instead of carrying the deleted records
+    assert ledger.totals == {"gemini": {"seo": [1, 10, 10, 0.0]}}
+    for _ in range(2):
+        assert UsageLedger(path).totals == {"gemini": {"seo": [1, 10, 10, 0.0]}}
+        os.remove(path + ".agg.json")
+
+
+def test_ledger_rotated_under_live_writer(path):
+    ledger = UsageLedger(path, batch_size=1)
+    ledger.record("chatgpt", "desc", 1, 1)
+    os.rename(path, path + ".1")
+    with UsageLedger(path) as other:
+        fill(other)
+    ledger.record("gemini", "seo", 10, 10)
+
+    os.remove(path + ".agg.json")
+    reloaded = UsageLedger(path)
+    assert reloaded.grand_total()[0] == 4
+    assert "desc" not in reloaded.totals["chatgpt"]
+    assert UsageLedger(path + ".1").totals == {"chatgpt": {"desc": [1, 1, 1, pytest.approx(0.00004)]}}
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda snap: snap.pop("totals"),
+    lambda snap: snap.update(offset=len(MAGIC) + 3),
+    lambda snap: snap.update(strings=["gemini"], file_id=[0, 0]),
+])
+def test_bad_snapshot_falls_back_to_full_replay(path, corrupt):
+    with UsageLedger(path) as ledger:
+        fill(ledger)
+    expected = UsageLedger(path)
+    with open(path + ".agg.json", encoding="utf-8") as f:
+        snap = json.load(f)
+    corrupt(snap)
+    with open(path + ".agg.json", "w", encoding="utf-8") as f:
+        json.dump(snap, f)
+
+    reloaded = UsageLedger(path)
+    assert (reloaded.totals, reloaded.strings) == (expected.totals, expected.strings)
+
+
+def test_snapshot_that_is_not_an_object(path):
+    with UsageLedger(path) as ledger:
+        fill(ledger)
+    expected = UsageLedger(path).totals
+    with open(path + ".agg.json", "w", encoding="utf-8") as f:
+        f.write("[1]")
+
+    assert UsageLedger(path).totals == expected
+
+
+def test_snapshot_of_replaced_ledger_is_ignored(path):
+    with UsageLedger(path) as ledger:
+        fill(ledger)
+    with open(path, "rb") as f:
+        original = f.read()
+    with open(path + ".new", "wb") as f:
+        f.write(original)
+    os.replace(path + ".new", path)
+    with open(path + ".agg.json", encoding="utf-8") as f:
+        snap = json.load(f)
+    snap["strings"].reverse()
+    with open(path + ".agg.json", "w", encoding="utf-8") as f:
+        json.dump(snap, f)
+
+    reloaded = UsageLedger(path)
+    assert reloaded.strings == ["chatgpt", "description", "tags", "gemini"]
@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Google Apps Scripts - AI Usage Ledger
+Buffered, append-only record of AI model calls with running cost aggregates.
+
+The Apps Script version (logAIUsage in AI-ENHANCED-GOOGLE-APPS-SCRIPT.gs)
+appends one sheet row per model call. This ledger buffers events in memory,
+writes them in batches to a compact binary file and keeps per-model/per-task
+totals in a small snapshot next to it, so reports never rescan the log.
+Error logging (logError in the news scripts) is not covered; it stays in the
+Error_Log sheet.
+
+Run: python usage_ledger.py --report
+     python usage_ledger.py --profile
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import struct
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, so only one writer is supported
+    fcntl = None
+
+try:
+    from rich.console import Console
+    from rich.table import Table
+    from rich import box
+    RICH_AVAILABLE = True
+except ImportError:
+    RICH_AVAILABLE = False
+
+console = Console() if RICH_AVAILABLE else None
+
+DEFAULT_LEDGER = "ai_usage.ledger"
+DEFAULT_BATCH_SIZE = 100
+
+# Cost per 1K tokens as (prompt, response); same estimates as logAIUsage
+MODEL_RATES: Dict[str, Tuple[float, float]] = {
+    "chatgpt": (0.01, 0.03),  # GPT-4 pricing
+    "gemini": (0.0, 0.0),     # Gemini is free for now
+}
+
+# File layout: MAGIC, then a stream of tagged records.
+#   b"S" <id:u16> <len:u16> <utf-8 bytes>        string table entry
+#   b"E" <ts:f64> <model:u16> <task:u16>
+#        <prompt:u32> <response:u32> <cost:f64>   usage event
+MAGIC = b"AIUL\x01"
+_STRING_HEADER = struct.Struct("<HH")
+_EVENT = struct.Struct("<dHHIId")
+MAX_STRINGS = 0xFFFF + 1
+MAX_STRING_BYTES = 0xFFFF
+MAX_TOKENS = 0xFFFFFFFF
+
+# Aggregate slot order: calls, prompt tokens, response tokens, cost
+Totals = List[float]
+Event = Tuple[float, str, str, int, int, float]
+
+
+def estimate_cost(model: str, prompt_tokens: int, response_tokens: int) -> float:
+    prompt_rate, response_rate = MODEL_RATES.get(model, (0.0, 0.0))
+    return prompt_tokens / 1000 * prompt_rate + response_tokens / 1000 * response_rate
+
+
+def _check_tokens(name: str, value: int) -> int:
+    count = int(value)
+    if not 0 <= count <= MAX_TOKENS:
+        raise ValueError(f"{name} must be between 0 and {MAX_TOKENS}, got {value!r}")
+    return count
+
+
+class UsageLedger:
+    """Append-only AI usage log with in-memory batching and running totals.
+
+    Use as a context manager (or call close()) so the last partial batch
+    is written out. Writers take an flock on the ledger while flushing and
+    first catch up on records other writers appended, so several processes
+    can share one file. Where fcntl is unavailable (Windows) only a single
+    writer is supported.
+    """
+
+    def __init__(self, path: str = DEFAULT_LEDGER, batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        self.path = path
+        self.snapshot_path = path + ".agg.json"
+        self.batch_size = max(1, batch_size)
+        self.strings: List[str] = []
+        self.string_ids: Dict[str, int] = {}
+        self.totals: Dict[str, Dict[str, Totals]] = {}
+        self.first_ts: Optional[float] = None
+        self.last_ts: Optional[float] = None
+        self._offset = 0
+        self._file_id: Optional[Tuple[int, int]] = None
+        self._pending: List[Event] = []
+        self._pending_strings: Set[str] = set()
+        self._load()
+
+    # ---------- recording ----------
+
+    def record(self, model: str, task: str, prompt_tokens: int, response_tokens: int,
+               cost: Optional[float] = None, timestamp: Optional[float] = None) -> float:
+        """Buffer one model call and return its cost estimate."""
+        prompt_tokens = _check_tokens("prompt_tokens", prompt_tokens)
+        response_tokens = _check_tokens("response_tokens", response_tokens)
+        new_strings = {s for s in (model, task)
+                       if s not in self.string_ids and s not in self._pending_strings}
+        for value in new_strings:
+            if len(value.encode("utf-8")) > MAX_STRING_BYTES:
+                raise ValueError(f"model/task name longer than {MAX_STRING_BYTES} bytes: {value[:40]!r}...")
+        if len(self.strings) + len(self._pending_strings) + len(new_strings) > MAX_STRINGS:
+            raise ValueError(f"ledger string table is full ({MAX_STRINGS} model/task names)")
+        cost = float(estimate_cost(model, prompt_tokens, response_tokens) if cost is None else cost)
+        ts = time.time() if timestamp is None else float(timestamp)
+
+        self._pending.append((ts, model, task, prompt_tokens, response_tokens, cost))
+        self._pending_strings |= new_strings
+        self._apply(ts, model, task, prompt_tokens, response_tokens, cost)
+
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        return cost
+
+    def flush(self) -> None:
+        """Write buffered events in one append and refresh the snapshot."""
+        if not self._pending:
+            return
+        with open(self.path, "ab") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                st = os.fstat(f.fileno())
+                size = st.st_size
+                if (st.st_dev, st.st_ino) != self._file_id or size < self._offset:
+                    # Ledger was deleted, rotated or replaced: start over on the new file
+                    self._reset()
+                    for event in self._pending:
+                        self._apply(*event)
+                    self._file_id = (st.st_dev, st.st_ino)
+                # Pick up records from other writers so string ids stay shared
+                self._replay(size)
+                if size > self._offset:
+                    # _replay only stops short at a partial record left by a crash
+                    f.truncate(self._offset)
+
+                data, strings = self._encode_pending()
+                if self._offset == 0:
+                    data = MAGIC + data
+                f.write(data)
+                f.flush()
+                self._offset += len(data)
+                for value in strings:
+                    self.string_ids[value] = len(self.strings)
+                    self.strings.append(value)
+                self._pending.clear()
+                self._pending_strings.clear()
+                self._write_snapshot()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> "UsageLedger":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ---------- aggregates ----------
+
+    def by_model(self) -> Dict[str, Totals]:
+        """Totals per model, summed across tasks."""
+        result: Dict[str, Totals] = {}
+        for model, tasks in self.totals.items():
+            agg = [0, 0, 0, 0.0]
+            for row in tasks.values():
+                for i, value in enumerate(row):
+                    agg[i] += value
+            result[model] = agg
+        return result
+
+    def grand_total(self) -> Totals:
+        agg = [0, 0, 0, 0.0]
+        for row in self.by_model().values():
+            for i, value in enumerate(row):
+                agg[i] += value
+        return agg
+
+    # ---------- internals ----------
+
+    def _encode_pending(self) -> Tuple[bytearray, List[str]]:
+        """Encode buffered events against the on-disk string table.
+
+        Returns the bytes to append and the strings they introduce, which
+        the caller adds to the table once the write succeeds.
+        """
+        data = bytearray()
+        added: List[str] = []
+        ids: Dict[str, int] = {}
+
+        def string_id(value: str) -> int:
+            idx = self.string_ids.get(value, ids.get(value))
+            if idx is None:
+                idx = len(self.strings) + len(added)
+                if idx >= MAX_STRINGS:
+                    raise ValueError(f"ledger string table is full ({MAX_STRINGS} model/task names)")
+                encoded = value.encode("utf-8")
+                data.extend(b"S" + _STRING_HEADER.pack(idx, len(encoded)) + encoded)
+                added.append(value)
+                ids[value] = idx
+            return idx
+
+        for ts, model, task, prompt_tokens, response_tokens, cost in self._pending:
+            model_id = string_id(model)
+            task_id = string_id(task)
+            data.extend(b"E" + _EVENT.pack(ts, model_id, task_id, prompt_tokens, response_tokens, cost))
+        return data, added
+
+    def _apply(self, ts: float, model: str, task: str, prompt_tokens: int,
+               response_tokens: int, cost: float) -> None:
+        row = self.totals.setdefault(model, {}).setdefault(task, [0, 0, 0, 0.0])
+        row[0] += 1
+        row[1] += prompt_tokens
+        row[2] += response_tokens
+        row[3] += cost
+        if self.first_ts is None or ts < self.first_ts:
+            self.first_ts = ts
+        if self.last_ts is None or ts > self.last_ts:
+            self.last_ts = ts
+
+    def _reset(self) -> None:
+        self.strings = []
+        self.string_ids = {}
+        self.totals = {}
+        self.first_ts = None
+        self.last_ts = None
+        self._offset = 0
+
+    def _load(self) -> None:
+        """Restore totals from the snapshot, then replay any newer records."""
+        if not os.path.exists(self.path):
+            return
+        st = os.stat(self.path)
+        self._file_id = (st.st_dev, st.st_ino)
+        snap = self._read_snapshot(st.st_size)
+        if snap is not None:
+            self.strings, self.totals, self.first_ts, self.last_ts, self._offset = snap
+            self.string_ids = {s: i for i, s in enumerate(self.strings)}
+        try:
+            replayed = self._replay(st.st_size)
+        except ValueError:
+            if snap is None:
+                raise
+            # The snapshot is only a cache; rebuild everything from the ledger
+            self._reset()
+            self._replay(st.st_size)
+            replayed = True
+        if replayed:
+            self._write_snapshot()
+
+    def _read_snapshot(self, size: int) -> Optional[tuple]:
+        """Parse the snapshot, or return None if it is missing or unusable."""
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(snap, dict):
+            return None
+
+        if snap.get("file_id") != list(self._file_id or ()):
+            return None  # written for an earlier (rotated or replaced) ledger file
+        offset = snap.get("offset")
+        strings = snap.get("strings")
+        totals = snap.get("totals")
+        first_ts = snap.get("first_ts")
+        last_ts = snap.get("last_ts")
+
+        def is_number(value) -> bool:
+            return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+        if not (isinstance(offset, int) and not isinstance(offset, bool) and 0 <= offset <= size):
+            return None
+        if not (isinstance(strings, list) and all(isinstance(s, str) for s in strings)
+                and len(set(strings)) == len(strings)):
+            return None
+        if not isinstance(totals, dict):
+            return None
+        for tasks in totals.values():
+            if not isinstance(tasks, dict):
+                return None
+            for row in tasks.values():
+                if not (isinstance(row, list) and len(row) == 4 and all(is_number(v) for v in row)):
+                    return None
+        if not all(ts is None or is_number(ts) for ts in (first_ts, last_ts)):
+            return None
+        return strings, totals, first_ts, last_ts, offset
+
+    def _replay(self, size: int) -> bool:
+        """Apply complete records between the current offset and size.
+
+        Stops before a partial record at the end of the file; raises
+        ValueError for anything that is not a valid ledger record.
+        """
+        if self._offset >= size:
+            return False
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read(size - self._offset)
+
+        base = self._offset
+        pos = 0
+        if base == 0:
+            if len(data) < len(MAGIC) and MAGIC.startswith(data):
+                # Header cut short by a crash during the first flush
+                return False
+            if not data.startswith(MAGIC):
+                raise ValueError(f"{self.path} is not an AI usage ledger")
+            pos = len(MAGIC)
+            self._offset = pos
+
+        replayed = False
+        while pos < len(data):
+            tag = data[pos:pos + 1]
+            if tag == b"S":
+                start = pos + 1 + _STRING_HEADER.size
+                if start > len(data):
+                    break
+                idx, length = _STRING_HEADER.unpack_from(data, pos + 1)
+                if start + length > len(data):
+                    break
+                value = data[start:start + length].decode("utf-8")
+                if idx != len(self.strings) or value in self.string_ids:
+                    raise ValueError(
+                        f"{self.path}: string entry {idx} ({value!r}) at byte {base + pos} "
+                        f"conflicts with the string table ({len(self.strings)} entries)"
+                    )
+                self.strings.append(value)
+                self.string_ids[value] = idx
+                pos = start + length
+            elif tag == b"E":
+                if pos + 1 + _EVENT.size > len(data):
+                    break
+                ts, model_id, task_id, prompt, response, cost = _EVENT.unpack_from(data, pos + 1)
+                if model_id >= len(self.strings) or task_id >= len(self.strings):
+                    raise ValueError(
+                        f"{self.path}: event at byte {base + pos} references an unknown string id"
+                    )
+                self._apply(ts, self.strings[model_id], self.strings[task_id], prompt, response, cost)
+                pos += 1 + _EVENT.size
+            else:
+                raise ValueError(f"{self.path}: unknown record tag {tag!r} at byte {base + pos}")
+            self._offset = base + pos
+            replayed = True
+        return replayed
+
+    def _write_snapshot(self) -> None:
+        snap = {
+            "offset": self._offset,
+            "strings": self.strings,
+            "totals": self.totals,
+            "first_ts": self.first_ts,
+            "last_ts": self.last_ts,
+            "file_id": self._file_id,
+        }
+        tmp = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snap, f)
+        os.replace(tmp, self.snapshot_path)
+
+
+# ---------- reports ----------
+
+def print_cost_report(ledger: UsageLedger) -> None:
+    rows = [
+        (model, task, row)
+        for model, tasks in sorted(ledger.totals.items())
+        for task, row in sorted(tasks.items())
+    ]
+    calls, prompt, response, cost = ledger.grand_total()
+
+    if RICH_AVAILABLE:
+        table = Table(title="💰 AI Usage by Model & Task", box=box.ROUNDED)
+        table.add_column("Model", style="cyan")
+        table.add_column("Task", style="gold1")
+        table.add_column("Calls", justify="right")
+        table.add_column("Prompt Tokens", justify="right", style="dim")
+        table.add_column("Response Tokens", justify="right", style="dim")
+        table.add_column("Cost", justify="right", style="green")
+        for model, task, (c, p, r, usd) in rows:
+            table.add_row(model, task, f"{int(c):,}", f"{int(p):,}", f"{int(r):,}", f"${usd:.4f}")
+        table.add_section()
+        table.add_row("[bold]Total[/bold]", "", f"{int(calls):,}", f"{int(prompt):,}",
+                      f"{int(response):,}", f"[bold]${cost:.4f}[/bold]")
+        console.print(table)
+    else:
+        for model, task, (c, p, r, usd) in rows:
+            print(f"  {model:<10} {task:<14} {int(c):>7} calls  {int(p):>10} in  {int(r):>10} out  ${usd:.4f}")
+        print(f"  {'Total':<25} {int(calls):>7} calls  {int(prompt):>10} in  {int(response):>10} out  ${cost:.4f}")
+
+
+def print_profile(ledger: UsageLedger) -> None:
+    models = ledger.by_model()
+    total_cost = ledger.grand_total()[3] or 1.0
+
+    if RICH_AVAILABLE:
+        table = Table(title="📊 AI Usage Profile", box=box.ROUNDED)
+        table.add_column("Model", style="cyan")
+        table.add_column("Calls", justify="right")
+        table.add_column("Avg In", justify="right", style="dim")
+        table.add_column("Avg Out", justify="right", style="dim")
+        table.add_column("Cost / Call", justify="right")
+        table.add_column("Cost Share")
+        for model, (c, p, r, usd) in sorted(models.items(), key=lambda kv: -kv[1][3]):
+            share = usd / total_cost
+            bar = "█" * round(share * 10) + "░" * (10 - round(share * 10))
+            table.add_row(model, f"{int(c):,}", f"{p / c:,.0f}", f"{r / c:,.0f}",
+                          f"${usd / c:.4f}", f"[green]{bar}[/green] {share:.0%}")
+        console.print(table)
+    else:
+        for model, (c, p, r, usd) in sorted(models.items(), key=lambda kv: -kv[1][3]):
+            print(f"  {model:<10} {int(c):>7} calls  avg {p / c:,.0f} in / {r / c:,.0f} out  "
+                  f"${usd / c:.4f}/call  {usd / total_cost:.0%} of cost")
+
+    if ledger.first_ts is not None:
+        start = time.strftime("%Y-%m-%d %H:%M", time.localtime(ledger.first_ts))
+        end = time.strftime("%Y-%m-%d %H:%M", time.localtime(ledger.last_ts))
+        if RICH_AVAILABLE:
+            console.print(f"\n  [dim]Window:[/dim] {start} → {end}")
+        else:
+            print(f"\n  Window: {start} → {end}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Report on the AI usage ledger.")
+    parser.add_argument("--ledger", default=DEFAULT_LEDGER, help="ledger file path")
+    parser.add_argument("--report", action="store_true", help="cost per model and task")
+    parser.add_argument("--profile", action="store_true", help="per-model usage dashboard")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.ledger):
+        print(f"No ledger found at {args.ledger}")
+        return
+
+    ledger = UsageLedger(args.ledger)
+    if args.profile:
+        print_profile(ledger)
+    if args.report or not args.profile:
+        print_cost_report(ledger)
+
+
+if __name__ == "__main__":
+    main()